@@ -4,11 +4,26 @@ Decode base64-encoded image (PNG/JPEG) from PARCS output file
 Compatible with Python 2.7 and Python 3.x
 Usage: python decode_output.py output.txt map.png
        python decode_output.py output.txt map.jpg
+Batch outputs (one AREA|<name> block per area) are written as map_<name>.png
+The image is PNG, JPEG or WebP depending on the solver's output_format
 """
 from __future__ import print_function
+import os
 import sys
 import base64
 
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 0, '.png'),
+    (b'\xff\xd8', 0, '.jpg'),
+    (b'WEBP', 8, '.webp'),
+)
+
+def detect_extension(data):
+    for signature, offset, ext in IMAGE_SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return ext
+    return None
+
 def decode_png(input_file, output_file):
     with open(input_file, 'r') as f:
         content = f.read()
@@ -16,29 +31,55 @@ def decode_png(input_file, output_file):
     # Extract base64 content between markers
     start_marker = "PNG_BASE64_START\n"
     end_marker = "\nPNG_BASE64_END"
+    area_marker = "AREA|"
     
-    start_idx = content.find(start_marker)
-    end_idx = content.find(end_marker)
+    blocks = []
+    pos = 0
+    while True:
+        start_idx = content.find(start_marker, pos)
+        if start_idx == -1:
+            break
+        end_idx = content.find(end_marker, start_idx)
+        if end_idx == -1:
+            break
+        
+        # Optional area name on the line before the block
+        name = None
+        line_start = content.rfind("\n", 0, max(0, start_idx - 1)) + 1
+        header = content[line_start:start_idx].strip()
+        if header.startswith(area_marker):
+            name = header[len(area_marker):]
+        
+        blocks.append((name, content[start_idx + len(start_marker):end_idx]))
+        pos = end_idx + len(end_marker)
     
-    if start_idx == -1 or end_idx == -1:
+    if not blocks:
         print("ERROR: Could not find base64 markers in output file")
         sys.exit(1)
     
-    base64_data = content[start_idx + len(start_marker):end_idx]
-    
-    # Decode (Python 2/3 compatible)
-    try:
-        png_data = base64.b64decode(base64_data)
-    except Exception as e:
-        print("ERROR: Failed to decode base64 data: {}".format(e))
-        sys.exit(1)
-    
-    # Save
-    with open(output_file, 'wb') as f:
-        f.write(png_data)
-    
-    size_mb = len(png_data) / (1024.0 * 1024.0)
-    print("Successfully decoded {:.2f} MB image to {}".format(size_mb, output_file))
+    root, ext = os.path.splitext(output_file)
+    for name, base64_data in blocks:
+        target = output_file
+        if len(blocks) > 1 or name:
+            target = "{}_{}{}".format(root, name, ext)
+        
+        # Decode (Python 2/3 compatible)
+        try:
+            png_data = base64.b64decode(base64_data)
+        except Exception as e:
+            print("ERROR: Failed to decode base64 data: {}".format(e))
+            sys.exit(1)
+        
+        # Save
+        with open(target, 'wb') as f:
+            f.write(png_data)
+        
+        size_mb = len(png_data) / (1024.0 * 1024.0)
+        print("Successfully decoded {:.2f} MB image to {}".format(size_mb, target))
+        actual = detect_extension(png_data)
+        if actual and actual != ext.lower() and not (actual == '.jpg' and ext.lower() == '.jpeg'):
+            print("Note: the image is {} data; rename to {} if your viewer needs it".format(
+                actual[1:].upper(), os.path.splitext(target)[0] + actual))
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
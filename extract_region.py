@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Cut a window out of a job's stored tiles without stitching the full mosaic.
+
+Only the tiles that intersect the window are read and decoded, so a small
+area of a huge job costs a few tile reads instead of decoding the whole
+output image.
+
+--bbox takes a lat/lon box and needs a SQLite tile archive (archive=<path>
+in python3/solver.py): its metadata gives zoom, scale and tile size, and its
+map table the center each tile was requested at (calculate_tile_coordinates),
+which places every tile on the Web Mercator pixel grid.
+
+--window takes a pixel box in the stitched mosaic's coordinates (what
+merge_tiles.py would produce for the same inputs). It works for archives and
+TILE|row|col|<base64> files alike, with --manifest as in merge_tiles.py.
+
+Usage:
+    extract_region.py out.jpg job.mbtiles --bbox <south> <west> <north> <east>
+    extract_region.py out.png job.mbtiles --window <x0> <y0> <x1> <y1>
+    extract_region.py out.jpg tiles_a.txt tiles_b.txt --window 0 0 4096 4096 [--manifest shards.json]
+"""
+
+import argparse
+import math
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from merge_tiles import TileArchive, is_archive, load_by_manifest, load_by_offset
+
+
+def latlon_to_world_px(lat, lon, zoom):
+    """Web Mercator pixel at zoom (256 px world tile), as in Solver.calculate_tile_coordinates."""
+    world_px = 256 * (2 ** zoom)
+    x = (lon + 180.0) / 360.0 * world_px
+    siny = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + siny) / (1 - siny)) / (4 * math.pi)) * world_px
+    return x, y
+
+
+def paste_tiles(size, placements):
+    """Decode each (loader, x, y) tile and paste it at (x, y) of a size canvas; returns (image, decoded)."""
+    canvas = Image.new('RGB', size, (0, 0, 0))
+    decoded = 0
+    for loader, x, y in placements:
+        data = loader()
+        if not data:
+            continue
+        with Image.open(BytesIO(data)) as tile:
+            canvas.paste(tile, (int(round(x)), int(round(y))))
+        decoded += 1
+    return canvas, decoded
+
+
+def extract_bbox(archive_path, south, west, north, east):
+    """Tiles of an archive intersecting a lat/lon box, cropped to it at the archive's resolution.
+
+    Returns (image, tiles_decoded, tiles_stored).
+    """
+    archive = TileArchive(archive_path)
+    meta = archive.metadata
+    zoom, scale = int(meta['zoom']), int(meta['scale'])
+    tile_size = int(meta['tile_size'])
+    tile_w = int(meta.get('tile_width', tile_size * scale))
+    tile_h = int(meta.get('tile_height', tile_w - int(meta.get('crop_bottom', 0))))
+
+    # Output pixels: world pixels at zoom times scale
+    x0, y0 = (v * scale for v in latlon_to_world_px(north, west, zoom))
+    x1, y1 = (v * scale for v in latlon_to_world_px(south, east, zoom))
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError("Empty bounding box (expected south < north and west < east)")
+
+    # Top-left of each tile: the requested center minus half the uncropped tile.
+    # Tiles stored without a center sit on the same regular grid as the others.
+    tiles = archive.centers()
+    origins = {}
+    ref = None
+    for (row, col), (tile_id, lat, lon) in tiles.items():
+        if lat is None or lon is None:
+            continue
+        cx, cy = latlon_to_world_px(lat, lon, zoom)
+        origins[(row, col)] = ((cx - tile_size / 2.0) * scale, (cy - tile_size / 2.0) * scale)
+        ref = ref or (row, col)
+    if ref is None:
+        raise ValueError(f"Archive {archive_path} stores no tile centers")
+    ref_x, ref_y = origins[ref]
+    for row, col in tiles:
+        if (row, col) not in origins:
+            origins[(row, col)] = (ref_x + (col - ref[1]) * tile_w, ref_y + (row - ref[0]) * tile_h)
+
+    placements = [(lambda tile_id=tiles[pos][0]: archive.read(tile_id), x - x0, y - y0)
+                  for pos, (x, y) in sorted(origins.items())
+                  if x < x1 and x + tile_w > x0 and y < y1 and y + tile_h > y0]
+    size = (max(1, int(round(x1 - x0))), max(1, int(round(y1 - y0))))
+    image, decoded = paste_tiles(size, placements)
+    return image, decoded, len(tiles)
+
+
+def extract_window(tile_files, x0, y0, x1, y1, manifest_path=None):
+    """Pixel window of the mosaic merge_tiles.py would build from tile_files.
+
+    Returns (image, tiles_decoded, tiles_stored).
+    """
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError("Empty pixel window (expected x0 < x1 and y0 < y1)")
+    if manifest_path:
+        all_tiles, _, _ = load_by_manifest(manifest_path, tile_files)
+    else:
+        all_tiles, _, _ = load_by_offset(tile_files)
+    if not all_tiles:
+        raise ValueError("No tiles loaded")
+
+    # Tile size from the archive metadata, else from the first tile's header
+    meta = TileArchive(tile_files[0]).metadata if is_archive(tile_files[0]) else {}
+    if 'tile_width' in meta and 'tile_height' in meta:
+        tile_w, tile_h = int(meta['tile_width']), int(meta['tile_height'])
+    else:
+        with Image.open(BytesIO(next(iter(all_tiles.values()))())) as first:
+            tile_w, tile_h = first.size
+
+    placements = []
+    for (row, col), loader in sorted(all_tiles.items()):
+        x, y = col * tile_w, row * tile_h
+        if x < x1 and x + tile_w > x0 and y < y1 and y + tile_h > y0:
+            placements.append((loader, x - x0, y - y0))
+    image, decoded = paste_tiles((x1 - x0, y1 - y0), placements)
+    return image, decoded, len(all_tiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('output')
+    parser.add_argument('tiles', nargs='+', help='tile archive(s) or TILE|row|col|b64 files')
+    box = parser.add_mutually_exclusive_group(required=True)
+    box.add_argument('--bbox', nargs=4, type=float, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'))
+    box.add_argument('--window', nargs=4, type=int, metavar=('X0', 'Y0', 'X1', 'Y1'))
+    parser.add_argument('--manifest', help='shard manifest from plan_shards.py (with --window)')
+    parser.add_argument('--quality', type=int, default=92, help='JPEG/WebP quality of the output')
+    args = parser.parse_args()
+
+    start = time.time()
+    try:
+        if args.bbox:
+            if len(args.tiles) != 1 or not is_archive(args.tiles[0]):
+                parser.error("--bbox needs exactly one tile archive (archive=<path> in python3/solver.py)")
+            image, decoded, stored = extract_bbox(args.tiles[0], *args.bbox)
+        else:
+            image, decoded, stored = extract_window(args.tiles, *args.window, manifest_path=args.manifest)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+
+    image.save(args.output, quality=args.quality)
+    print(f"Region: {image.size[0]}x{image.size[1]} px from {decoded} of {stored} stored tiles")
+    print(f"Total time: {time.time() - start:.2f}s")
+    print(f"Saved to: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,7 +11,8 @@ param(
   [switch]$ForceRebuild,
   [int]$Concurrency = 16,
   [int]$MaxRegions = 0,
-  [switch]$Optimized
+  [switch]$Optimized,
+  [string]$ShardManifest = ""
 )
 
 $ErrorActionPreference = "Continue"
@@ -58,19 +59,39 @@ Write-Host "Total tiles: $totalTiles"
 Write-Host "Splitting across $($hosts.Count) regions"
 
 # Calculate tile ranges
-$tilesPerRegion = [Math]::Ceiling($totalTiles / $hosts.Count)
 $assignments = @()
-$idx = 0
-foreach ($h in $hosts) {
-  $start = $idx
-  $end = [Math]::Min($idx + $tilesPerRegion, $totalTiles)
-  $assignments += @{
-    host = $h
-    start = $start
-    end = $end
-    count = $end - $start
+if ($ShardManifest) {
+  # Throughput-weighted row shards from plan_shards.py (merge with merge_tiles.py --manifest)
+  $manifest = Get-Content $ShardManifest -Raw | ConvertFrom-Json
+  foreach ($h in $hosts) {
+    $region = ($h.name -replace "parcsnet-mr-", "" -replace "-host", "")
+    $shard = $manifest.shards | Where-Object { $_.region -eq $region } | Select-Object -First 1
+    if (-not $shard) {
+      Write-Host "  $region has no shard in $ShardManifest; skipping"
+      continue
+    }
+    $assignments += @{
+      host = $h
+      start = [int]$shard.tile_start
+      end = [int]$shard.tile_end
+      count = [int]$shard.tiles
+    }
+  }
+  $tilesPerRegion = [Math]::Ceiling($totalTiles / [Math]::Max(1, $assignments.Count))
+} else {
+  $tilesPerRegion = [Math]::Ceiling($totalTiles / $hosts.Count)
+  $idx = 0
+  foreach ($h in $hosts) {
+    $start = $idx
+    $end = [Math]::Min($idx + $tilesPerRegion, $totalTiles)
+    $assignments += @{
+      host = $h
+      start = $start
+      end = $end
+      count = $end - $start
+    }
+    $idx = $end
   }
-  $idx = $end
 }
 
 Write-Host ""
@@ -87,6 +108,7 @@ if (-not (Test-Path $baseDir)) { New-Item -ItemType Directory -Force -Path $base
 $outDir = Join-Path $baseDir ("federated_split_" + $stamp)
 New-Item -ItemType Directory -Force -Path $outDir | Out-Null
 Write-Host "Output: $outDir"
+if ($ShardManifest) { Copy-Item $ShardManifest (Join-Path $outDir "shards.json") }
 
 $publishDir = ".\csharp\ParcsNetMapsStitcher\bin\Release\netcoreapp2.1\linux-x64\publish"
 $sshKey = "C:\Users\Pavel\.ssh\google_compute_engine"
@@ -1,13 +1,52 @@
 #!/usr/bin/env python3
-"""Merge federated tile data and build mosaic."""
+"""Merge federated tile data and build mosaic.
+
+Inputs are TILE|row|col|<base64> text files or SQLite tile archives
+(written by python3/solver.py with archive=<path>); both can be mixed.
+With --manifest (from plan_shards.py) tiles are placed at the absolute
+positions of the planned grid; without it each file's rows are stacked
+below the previous file's last row.
+"""
 
 import sys
 import os
 import base64
+import json
+import sqlite3
 from io import BytesIO
 from PIL import Image
 import time
 
+ARCHIVE_SIGNATURE = b'SQLite format 3\x00'
+
+
+class TileArchive:
+    """Read side of the solver's SQLite tile archive: raw JPEG blobs by (row, col)."""
+
+    def __init__(self, filepath):
+        self.conn = sqlite3.connect(filepath)
+        self.metadata = dict(self.conn.execute("SELECT name, value FROM metadata"))
+
+    def positions(self):
+        """Map (row, col) -> tile_id from the index, without reading any blob."""
+        return {(row, col): tile_id for row, col, tile_id in
+                self.conn.execute("SELECT tile_row, tile_column, tile_id FROM map")}
+
+    def centers(self):
+        """Map (row, col) -> (tile_id, lat, lon), the tile centers the solver requested."""
+        return {(row, col): (tile_id, lat, lon) for row, col, tile_id, lat, lon in
+                self.conn.execute("SELECT tile_row, tile_column, tile_id, lat, lon FROM map")}
+
+    def read(self, tile_id):
+        row = self.conn.execute("SELECT tile_data FROM images WHERE tile_id = ?", (tile_id,)).fetchone()
+        return bytes(row[0]) if row else None
+
+
+def is_archive(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read(len(ARCHIVE_SIGNATURE)) == ARCHIVE_SIGNATURE
+
+
 def load_tiles_from_file(filepath):
     """Load tiles from a region tile data file."""
     tiles = {}
@@ -22,17 +61,23 @@ def load_tiles_from_file(filepath):
                 tiles[(row, col)] = b64
     return tiles
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: merge_tiles.py <output_image> <tile_file1> [tile_file2] ...")
-        sys.exit(1)
-    
-    output_path = sys.argv[1]
-    tile_files = sys.argv[2:]
-    
-    start = time.time()
-    
-    # Load all tiles with row offset per region
+
+def load_tiles(filepath):
+    """Return {(row, col): loader} for a text tile file or an archive, global grids shifted to (0, 0)."""
+    if is_archive(filepath):
+        archive = TileArchive(filepath)
+        positions = archive.positions()
+        row0 = col0 = 0
+        if positions and archive.metadata.get('grid') == 'global':
+            row0 = min(row for row, _ in positions)
+            col0 = min(col for _, col in positions)
+        return {(row - row0, col - col0): (lambda tile_id=tile_id: archive.read(tile_id))
+                for (row, col), tile_id in positions.items()}
+    return {pos: (lambda b64=b64: base64.b64decode(b64))
+            for pos, b64 in load_tiles_from_file(filepath).items()}
+
+def load_by_offset(tile_files):
+    """Stack files vertically, each starting below the previous file's last row."""
     all_tiles = {}
     max_row = 0
     max_col = 0
@@ -40,27 +85,82 @@ def main():
     
     for f in tile_files:
         print(f"Loading {f} (row_offset={row_offset})...")
-        tiles = load_tiles_from_file(f)
+        tiles = load_tiles(f)
         
         # Find max row in this region to calculate offset for next
         region_max_row = max(row for (row, col) in tiles.keys()) if tiles else 0
         
-        for (row, col), b64 in tiles.items():
+        for (row, col), loader in tiles.items():
             adjusted_row = row + row_offset
-            all_tiles[(adjusted_row, col)] = b64
+            all_tiles[(adjusted_row, col)] = loader
             max_row = max(max_row, adjusted_row)
             max_col = max(max_col, col)
         
         # Next region starts after this region's rows
         row_offset += region_max_row + 1
     
-    num_rows = max_row + 1
-    num_cols = max_col + 1
+    return all_tiles, max_row + 1, max_col + 1
+
+
+def load_by_manifest(manifest_path, tile_files):
+    """Place tiles from each shard's file at their absolute grid positions; returns (tiles, rows, cols)."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    shards = manifest['shards']
+    if tile_files and len(tile_files) != len(shards):
+        print(f"ERROR: manifest has {len(shards)} shards but {len(tile_files)} tile files were given")
+        sys.exit(1)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    files = tile_files or [os.path.join(base_dir, shard['file']) for shard in shards]
+
+    all_tiles = {}
+    num_rows, num_cols = manifest['grid']['rows'], manifest['grid']['cols']
+    for shard, path in zip(shards, files):
+        print(f"Loading {path} ({shard['region']}: rows {shard['row_start']}-{shard['row_end'] - 1})...")
+        if not os.path.exists(path):
+            print(f"  WARNING: missing file, {shard['tiles']} tiles left blank")
+            continue
+        tiles = load_tiles(path)
+        outside = 0
+        for (row, col), loader in tiles.items():
+            if not (shard['row_start'] <= row < shard['row_end'] and 0 <= col < num_cols):
+                outside += 1
+            all_tiles[(row, col)] = loader
+        if outside:
+            print(f"  WARNING: {outside} tiles outside the shard's rows")
+        if len(tiles) < shard['tiles']:
+            print(f"  {shard['tiles'] - len(tiles)} of {shard['tiles']} tiles missing")
+    return all_tiles, num_rows, num_cols
+
+
+def main():
+    args = sys.argv[1:]
+    manifest_path = None
+    if '--manifest' in args:
+        i = args.index('--manifest')
+        manifest_path = args[i + 1]
+        del args[i:i + 2]
+    if not args or (not manifest_path and len(args) < 2):
+        print("Usage: merge_tiles.py <output_image> <tile_file1> [tile_file2] ...")
+        print("       merge_tiles.py <output_image> --manifest shards.json [tile_file per shard ...]")
+        sys.exit(1)
+    
+    output_path = args[0]
+    tile_files = args[1:]
+    
+    start = time.time()
+    
+    if manifest_path:
+        all_tiles, num_rows, num_cols = load_by_manifest(manifest_path, tile_files)
+    else:
+        all_tiles, num_rows, num_cols = load_by_offset(tile_files)
     print(f"Grid: {num_rows}x{num_cols}, {len(all_tiles)} tiles")
+    if not all_tiles:
+        print("ERROR: no tiles loaded")
+        sys.exit(1)
     
     # Determine tile size from first tile
-    first_b64 = next(iter(all_tiles.values()))
-    first_bytes = base64.b64decode(first_b64)
+    first_bytes = next(iter(all_tiles.values()))()
     with Image.open(BytesIO(first_bytes)) as img:
         tile_w, tile_h = img.size
     print(f"Tile size: {tile_w}x{tile_h}")
@@ -76,8 +176,10 @@ def main():
     print(f"Load time: {load_time - start:.2f}s")
     
     # Paste tiles
-    for (row, col), b64 in all_tiles.items():
-        tile_bytes = base64.b64decode(b64)
+    for (row, col), loader in all_tiles.items():
+        tile_bytes = loader()
+        if not tile_bytes:
+            continue
         with Image.open(BytesIO(tile_bytes)) as tile:
             x = col * tile_w
             y = row * tile_h
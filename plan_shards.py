@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Plan a load-balanced federated split and write a shard manifest.
+
+Regions get contiguous row ranges of the federated runner's grid (rows and
+columns of 100 m, row-major tile indices, as in MapsStitcherMainModule.cs),
+sized by each region's measured throughput so all regions finish together.
+The manifest lists every shard's absolute rows and its tile index range for
+--tilestart/--tileend. merge_tiles.py --manifest places tiles from it.
+
+Usage:
+    plan_shards.py <input.txt> --regions us-central1 europe-west1 asia-east1
+                   [--throughput results.csv ...] [--rate us-central1=3.2 ...]
+                   [--files "tiles_{region}.txt"] [--out shards.json]
+
+Throughput (tiles/s) comes from results.csv files written by
+gcp/run_federated_split.ps1 (tiles / download_s per region), or from --rate.
+Regions without a measurement get the mean of the measured ones.
+"""
+
+import argparse
+import csv
+import json
+import sys
+
+RESOLUTION_M = 100
+
+
+def read_grid(input_file):
+    """Rows/cols of the federated runner's grid for an input file."""
+    with open(input_file) as f:
+        values = [line.strip() for line in f
+                  if line.strip() and not line.strip().startswith('#') and '=' not in line]
+    lat, lon, height_m, width_m = (float(v) for v in values[:4])
+    rows = max(1, int(height_m / RESOLUTION_M))
+    cols = max(1, int(width_m / RESOLUTION_M))
+    return lat, lon, height_m, width_m, rows, cols
+
+
+def measured_rates(csv_files):
+    """Mean tiles/s per region over results.csv rows."""
+    samples = {}
+    for path in csv_files:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                tiles = float(row.get('tiles') or 0)
+                seconds = float(row.get('download_s') or 0)
+                if tiles > 0 and seconds > 0:
+                    samples.setdefault(row['region'], []).append(tiles / seconds)
+    return {region: sum(v) / len(v) for region, v in samples.items()}
+
+
+def balance_rows(rows, cols, rates):
+    """Whole rows per region minimizing the slowest region's predicted time.
+
+    Rows are handed out one at a time to the region that would finish
+    earliest with it, which is optimal for equal-size rows.
+    """
+    counts = [0] * len(rates)
+    for _ in range(rows):
+        best = min(range(len(rates)), key=lambda i: ((counts[i] + 1) * cols / rates[i], i))
+        counts[best] += 1
+    return counts
+
+
+def plan(input_file, regions, rates, file_template):
+    lat, lon, height_m, width_m, rows, cols = read_grid(input_file)
+    counts = balance_rows(rows, cols, [rates[r] for r in regions])
+
+    shards = []
+    row = 0
+    for region, count in zip(regions, counts):
+        if count == 0:
+            continue
+        shards.append({
+            'region': region,
+            'row_start': row,
+            'row_end': row + count,
+            'tile_start': row * cols,
+            'tile_end': (row + count) * cols,
+            'tiles': count * cols,
+            'throughput_tps': round(rates[region], 3),
+            'predicted_s': round(count * cols / rates[region], 2),
+            'file': file_template.format(region=region),
+        })
+        row += count
+
+    # The runner's previous split: equal tile counts, cut anywhere in a row
+    total = rows * cols
+    per_region = -(-total // len(regions))
+    equal_s = max(min(per_region, max(0, total - i * per_region)) / rates[r] for i, r in enumerate(regions))
+
+    return {
+        'input': input_file,
+        'center': [lat, lon],
+        'size_m': [height_m, width_m],
+        'grid': {'rows': rows, 'cols': cols, 'resolution_m': RESOLUTION_M,
+                 'tile_order': 'row-major', 'tile_rows': 'absolute'},
+        'shards': shards,
+        'predicted_makespan_s': max(s['predicted_s'] for s in shards),
+        'equal_split_makespan_s': round(equal_s, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('input')
+    parser.add_argument('--regions', nargs='+', required=True)
+    parser.add_argument('--throughput', nargs='*', default=[], help='results.csv files from earlier runs')
+    parser.add_argument('--rate', nargs='*', default=[], help='region=tiles_per_second overrides')
+    parser.add_argument('--files', default='tiles_{region}.txt', help='tile file name per shard')
+    parser.add_argument('--out', default='shards.json')
+    args = parser.parse_args()
+
+    rates = measured_rates(args.throughput)
+    for item in args.rate:
+        region, value = item.split('=', 1)
+        rates[region] = float(value)
+    known = [rates[r] for r in args.regions if rates.get(r, 0) > 0]
+    default = sum(known) / len(known) if known else 1.0
+    for region in args.regions:
+        if rates.get(region, 0) <= 0:
+            print(f"No throughput measured for {region}; assuming {default:.2f} tiles/s")
+            rates[region] = default
+
+    manifest = plan(args.input, args.regions, rates, args.files)
+    with open(args.out, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    grid = manifest['grid']
+    print(f"Grid: {grid['rows']}x{grid['cols']} = {grid['rows'] * grid['cols']} tiles")
+    for s in manifest['shards']:
+        print(f"  {s['region']}: rows [{s['row_start']}, {s['row_end']}) = tiles "
+              f"[{s['tile_start']}, {s['tile_end']}) at {s['throughput_tps']:.2f} tiles/s -> {s['predicted_s']:.1f}s")
+    print(f"Predicted makespan: {manifest['predicted_makespan_s']:.1f}s "
+          f"(equal split: {manifest['equal_split_makespan_s']:.1f}s)")
+    print(f"Manifest written to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division
+
+"""
+Resident solver service: runs many input files against one warm worker pool.
+
+Every PARCS job starts cold (new worker processes, imports, HTTP sessions,
+latency history). The service keeps one local worker pool alive instead
+(see Solver._start_local_workers), so connection pools and caches in the
+worker processes carry over from job to job. Jobs wait in a queue and up to
+--jobs of them run at once, sharing the pool.
+
+Usage:
+    python service.py [--jobs N] [--local-workers N] input1.txt [input2.txt ...]
+    python service.py --watch spool/ [--poll 2]
+
+Each input is written to <input>.out.txt (decode with decode_output.py).
+In --watch mode every new *.txt in the directory is queued, and renamed to
+*.txt.done once its job has finished.
+"""
+
+import os
+import sys
+import time
+import threading
+import multiprocessing
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+from solver import Solver, _LocalWorker
+
+
+class Job(object):
+    def __init__(self, job_id, input_file, output_file):
+        self.job_id = job_id
+        self.input_file = input_file
+        self.output_file = output_file
+        self.work_dir = output_file + ".work"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def queue_s(self):
+        return (self.started or time.time()) - self.submitted
+
+    @property
+    def run_s(self):
+        return (self.finished or time.time()) - (self.started or time.time())
+
+
+class SolverService(object):
+    """Job queue in front of Solver, with one worker pool shared by every job."""
+
+    def __init__(self, workers=None, local_workers=0, max_jobs=2):
+        self.pool = None
+        if workers:
+            self.workers = workers
+        else:
+            if local_workers <= 0:
+                try:
+                    local_workers = multiprocessing.cpu_count()
+                except NotImplementedError:
+                    local_workers = 1
+            self.pool = multiprocessing.Pool(local_workers)
+            self.workers = [_LocalWorker(self.pool) for _ in xrange(local_workers)]
+        self.queue = Queue()
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.runners = []
+        for _ in xrange(max(1, max_jobs)):
+            t = threading.Thread(target=self._run)
+            t.daemon = True
+            t.start()
+            self.runners.append(t)
+        print("Solver service: {} workers, up to {} concurrent jobs".format(len(self.workers), len(self.runners)))
+
+    def submit(self, input_file, output_file=None):
+        with self.lock:
+            job = Job(len(self.jobs) + 1, input_file, output_file or input_file + ".out.txt")
+            self.jobs.append(job)
+        self.queue.put(job)
+        print("Job {} queued: {}".format(job.job_id, input_file))
+        return job
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            job.started = time.time()
+            try:
+                if not os.path.isdir(job.work_dir):
+                    os.makedirs(job.work_dir)
+                Solver(workers=self.workers, input_file_name=job.input_file,
+                       output_file_name=job.output_file, work_dir=job.work_dir).solve()
+            except Exception as e:
+                job.error = e
+            job.finished = time.time()
+            print("Job {} {}: queued {:.2f}s, ran {:.2f}s{}".format(
+                job.job_id, job.input_file, job.queue_s, job.run_s,
+                " (failed: {})".format(job.error) if job.error else ""))
+
+    def wait(self, jobs=None):
+        for job in jobs or list(self.jobs):
+            while job.finished is None:
+                time.sleep(0.2)
+
+    def report(self):
+        done = [job for job in self.jobs if job.started is not None and job.finished is not None]
+        if not done:
+            return
+        queue_s = sorted(job.queue_s for job in done)
+        latency = sorted(job.queue_s + job.run_s for job in done)
+        print("Service: {} jobs ({} failed); queue time median {:.2f}s max {:.2f}s; "
+              "latency median {:.2f}s max {:.2f}s".format(
+                  len(done), sum(1 for job in done if job.error), queue_s[len(queue_s) // 2], queue_s[-1],
+                  latency[len(latency) // 2], latency[-1]))
+
+    def close(self):
+        """Stop the runners after the jobs already running; queued jobs are cancelled."""
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except Empty:
+                break
+            if job is not None:
+                job.error = "cancelled"
+                job.finished = time.time()
+                print("Job {} cancelled: {}".format(job.job_id, job.input_file))
+        for _ in self.runners:
+            self.queue.put(None)
+        for t in self.runners:
+            t.join()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+def watch(service, directory, poll_s):
+    """Queue every new *.txt in directory; rename it to *.txt.done when its job ends."""
+    pending = {}
+    while True:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith('.txt') and not name.endswith('.out.txt') and path not in pending:
+                pending[path] = service.submit(path)
+        for path, job in list(pending.items()):
+            if job.finished is not None:
+                os.rename(path, path + ".done")
+                del pending[path]
+                service.report()
+        time.sleep(poll_s)
+
+
+def main(argv):
+    args = list(argv)
+    settings = {'--jobs': '2', '--local-workers': '0', '--watch': None, '--poll': '2'}
+    inputs = []
+    while args:
+        arg = args.pop(0)
+        if arg in settings and args:
+            settings[arg] = args.pop(0)
+        else:
+            inputs.append(arg)
+    if not inputs and not settings['--watch']:
+        print(__doc__)
+        return 1
+
+    service = SolverService(local_workers=int(settings['--local-workers']), max_jobs=int(settings['--jobs']))
+    try:
+        if settings['--watch']:
+            watch(service, settings['--watch'], float(settings['--poll']))
+        for path in inputs:
+            service.submit(path)
+        service.wait()
+        service.report()
+    except KeyboardInterrupt:
+        print("Stopping; finished jobs:")
+        service.report()
+    finally:
+        service.close()
+    return 1 if any(job.error for job in service.jobs) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
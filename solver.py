@@ -5,10 +5,9 @@ import os
 import sys
 import base64
 import math
+import multiprocessing
 import time
 import traceback
-import requests
-import numpy as np
 from PIL import Image
 
 try:
@@ -22,11 +21,40 @@ except ImportError:
     from StringIO import StringIO as BytesIO
 
 
+# -------------------------------------------------
+# Local multi-core backend (no PARCS workers attached)
+# -------------------------------------------------
+def _run_local(method, args):
+    return getattr(Solver, method)(*args)
+
+
+class _LocalFuture(object):
+    """PARCS-style future over a multiprocessing AsyncResult: .value blocks for the result."""
+
+    def __init__(self, result):
+        self._result = result
+
+    @property
+    def value(self):
+        return self._result.get()
+
+
+class _LocalWorker(object):
+    """Stands in for a PARCS worker; download_tiles runs in a shared local process pool."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def download_tiles(self, *args):
+        return _LocalFuture(self.pool.apply_async(_run_local, ('download_tiles', args)))
+
+
 class Solver(object):
     def __init__(self, workers=None, input_file_name=None, output_file_name=None):
         self.input_file_name = input_file_name
         self.output_file_name = output_file_name
         self.workers = workers or []
+        self._local_pool = None
         print("Solver initialized")
         print("Workers: {}".format(len(self.workers)))
 
@@ -35,6 +63,7 @@ class Solver(object):
             print("Job started - Google Maps parallel tile download and stitching")
 
             center_lat, center_lon, height_m, width_m, compress = self.read_input()
+            self._start_local_workers()
             print("Center: ({}, {})".format(center_lat, center_lon))
             print("Size: {}m x {}m".format(width_m, height_m))
             print("Compression: {}".format("Enabled (max 100MB)" if compress else "Disabled"))
@@ -71,6 +100,30 @@ class Solver(object):
             except Exception:
                 pass
             raise
+        finally:
+            self._stop_local_workers()
+
+    def _start_local_workers(self):
+        """Without PARCS workers (local.py), download 50-tile batches on a local process pool."""
+        count = int(os.environ.get('LOCAL_WORKERS', '0') or 0)
+        if count <= 0:
+            try:
+                count = multiprocessing.cpu_count()
+            except NotImplementedError:
+                count = 1
+        if self.workers or count <= 1:
+            return
+        self._local_pool = multiprocessing.Pool(count)
+        self.workers = [_LocalWorker(self._local_pool) for _ in xrange(count)]
+        print("No PARCS workers attached; using {} local worker processes".format(count))
+
+    def _stop_local_workers(self):
+        if self._local_pool is None:
+            return
+        self._local_pool.close()
+        self._local_pool.join()
+        self._local_pool = None
+        self.workers = []
 
     def process_region(self, center_lat, center_lon, width_m, height_m, output_path, compress=False):
         """Download tiles (via workers) and stitch to a mosaic."""
@@ -112,15 +165,26 @@ class Solver(object):
                 except Exception:
                     pass
         else:
-            # Round-robin distribution for better load balancing
             worker_tasks = []
-            for i, worker in enumerate(self.workers):
-                # Distribute tiles round-robin: worker i gets tiles at indices i, i+N, i+2N, ...
-                batch = [tile_requests[j] for j in xrange(i, len(tile_requests), num_workers)]
-                if batch:
-                    print("Worker {}: downloading {} tiles".format(i, len(batch)))
-                    fut = worker.download_tiles(batch, zoom, tile_size_px, scale, crop_bottom)
-                    worker_tasks.append((i, fut))
+            if self._local_pool is not None:
+                # Same 50-tile batches as the sequential path: download_tiles picks its
+                # JPEG quality from the batch size
+                batch_size = 50
+                for k, i in enumerate(xrange(0, len(tile_requests), batch_size)):
+                    batch = tile_requests[i:i + batch_size]
+                    worker_idx = k % num_workers
+                    print("Worker {}: downloading {} tiles".format(worker_idx, len(batch)))
+                    fut = self.workers[worker_idx].download_tiles(batch, zoom, tile_size_px, scale, crop_bottom)
+                    worker_tasks.append((worker_idx, fut))
+            else:
+                # Round-robin distribution for better load balancing
+                for i, worker in enumerate(self.workers):
+                    # Distribute tiles round-robin: worker i gets tiles at indices i, i+N, i+2N, ...
+                    batch = [tile_requests[j] for j in xrange(i, len(tile_requests), num_workers)]
+                    if batch:
+                        print("Worker {}: downloading {} tiles".format(i, len(batch)))
+                        fut = worker.download_tiles(batch, zoom, tile_size_px, scale, crop_bottom)
+                        worker_tasks.append((i, fut))
 
             print("Waiting for workers to download tiles...")
             for i, fut in worker_tasks:
@@ -334,6 +398,7 @@ class Solver(object):
         base_url = "https://maps.googleapis.com/maps/api/staticmap"
         results = []
 
+        import requests
         session = requests.Session()
         session.headers.update({'Connection': 'keep-alive'})
 